@@ -5,14 +5,19 @@
 
 from __future__ import annotations
 
-import math
 import re
 import string
+from functools import lru_cache
 from typing import TYPE_CHECKING
 
 import numpy as np
 from pymatgen.io.lammps.data import CombinedData
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 from . import MM_of_Elements
 
 if TYPE_CHECKING:
@@ -20,6 +25,127 @@ if TYPE_CHECKING:
     from MDAnalysis import Universe
     from MDAnalysis.core.groups import AtomGroup, Residue
 
+_EL_NAMES = np.array(list(MM_of_Elements.keys()))
+_EL_MASSES = np.array(list(MM_of_Elements.values()), dtype=np.float64)
+_EL_ORDER = np.argsort(_EL_MASSES)
+_EL_MASSES_SORTED = _EL_MASSES[_EL_ORDER]
+_EL_NAMES_SORTED = _EL_NAMES[_EL_ORDER]
+
+_HEADER_RE = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=None)
+def _type_sel(atom_type: str) -> str:
+    """
+    Build (and memoize) a "type X" selection string.
+
+    Args:
+        atom_type: The atom type.
+
+    Return:
+        The selection string.
+    """
+    return f"type {atom_type}"
+
+
+@lru_cache(maxsize=None)
+def _res_sel(selection: str) -> str:
+    """
+    Build (and memoize) a "same resid as (...)" selection string.
+
+    Args:
+        selection: The inner atom selection.
+
+    Return:
+        The residue selection string.
+    """
+    return f"same resid as ({selection})"
+
+
+if njit is not None:
+
+    @njit(cache=True)
+    def _match_masses(masses: np.ndarray, el_masses: np.ndarray, tol: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Nearest-element scan compiled with Numba; see ``_nearest_element``.
+
+        Args:
+            masses: A 1d float64 array of atomic masses.
+            el_masses: The sorted element mass table.
+            tol: Absolute tolerance for a mass to count as a match.
+
+        Return:
+            A tuple of the index array into ``el_masses`` and the
+            boolean mask of masses within tolerance of their match.
+        """
+        idx = np.empty(len(masses), dtype=np.int64)
+        valid = np.empty(len(masses), dtype=np.bool_)
+        for i in range(len(masses)):
+            best = 0
+            best_diff = abs(masses[i] - el_masses[0])
+            for j in range(1, len(el_masses)):
+                diff = abs(masses[i] - el_masses[j])
+                if diff < best_diff:
+                    best_diff = diff
+                    best = j
+            idx[i] = best
+            valid[i] = best_diff <= tol
+        return idx, valid
+
+    @njit(cache=True)
+    def _ion_centers(charges: np.ndarray, type_codes: np.ndarray, n_codes: int, charge_sign: int) -> tuple[int, int]:
+        """
+        Find the most charged atom and the rarest type code in one compiled pass.
+
+        Args:
+            charges: A 1d float64 array of atom charges.
+            type_codes: Integer type codes of the atoms, in [0, n_codes).
+            n_codes: The number of distinct type codes.
+            charge_sign: +1 to seek the most positive charge, -1 the most negative.
+
+        Return:
+            A tuple of the index of the most charged atom and the
+            rarest type code.
+        """
+        counts = np.zeros(n_codes, dtype=np.int64)
+        center_idx = 0
+        best = charge_sign * charges[0]
+        counts[type_codes[0]] += 1
+        for i in range(1, len(charges)):
+            signed = charge_sign * charges[i]
+            if signed > best:
+                best = signed
+                center_idx = i
+            counts[type_codes[i]] += 1
+        return center_idx, counts.argmin()
+
+
+def _nearest_element(masses: np.ndarray, tol: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Find the nearest element for each mass in the sorted mass table.
+
+    Uses a Numba-compiled scan when numba is installed (no temporaries,
+    compiled inner loop) and a binary search with np.searchsorted
+    otherwise.
+
+    Args:
+        masses: A 1d array of atomic masses.
+        tol: Absolute tolerance for a mass to count as a match.
+
+    Return:
+        A tuple of the index array into the sorted element tables and
+        the boolean mask of masses within tolerance of their match.
+    """
+    if njit is not None:
+        return _match_masses(np.ascontiguousarray(masses, dtype=np.float64), _EL_MASSES_SORTED, tol)
+    pos = np.searchsorted(_EL_MASSES_SORTED, masses)
+    left = np.clip(pos - 1, 0, len(_EL_MASSES_SORTED) - 1)
+    right = np.clip(pos, 0, len(_EL_MASSES_SORTED) - 1)
+    idx = np.where(
+        np.abs(masses - _EL_MASSES_SORTED[right]) < np.abs(masses - _EL_MASSES_SORTED[left]), right, left
+    )
+    return idx, np.abs(masses - _EL_MASSES_SORTED[idx]) <= tol
+
 
 def mass_to_name(masses: np.ndarray) -> np.ndarray:
     """
@@ -31,13 +157,12 @@ def mass_to_name(masses: np.ndarray) -> np.ndarray:
     Return:
         The element name array.
     """
-    names = []
-    for mass in masses:
-        for item in MM_of_Elements.items():
-            if math.isclose(mass, item[1], abs_tol=0.1):
-                names.append(item[0])
-    assert len(masses) == len(names), "Invalid mass found."
-    return np.array(names)
+    masses = np.asarray(masses, dtype=np.float64)
+    idx, valid = _nearest_element(masses, 0.1)
+    if not np.all(valid):
+        bad = np.flatnonzero(~valid)[0]
+        raise ValueError(f"Invalid mass {masses[bad]} found for atom index {bad}.")
+    return _EL_NAMES_SORTED[idx]
 
 
 def lmp_mass_to_name(df: pd.DataFrame) -> dict[int, str]:
@@ -49,12 +174,10 @@ def lmp_mass_to_name(df: pd.DataFrame) -> dict[int, str]:
     Return:
         The element dict.
     """
-    atoms = {}
-    for row in df.index:
-        for item in MM_of_Elements.items():
-            if math.isclose(df["mass"][row], item[1], abs_tol=0.01):
-                atoms[int(row)] = item[0]
-    return atoms
+    masses = df["mass"].to_numpy(dtype=np.float64)
+    rows = df.index.to_numpy()
+    idx, mask = _nearest_element(masses, 0.01)
+    return {int(r): str(_EL_NAMES_SORTED[i]) for r, i, ok in zip(rows, idx, mask) if ok}
 
 
 def assign_name(u: Universe, names: np.ndarray):
@@ -77,7 +200,8 @@ def assign_resname(u: Universe, res_dict: dict[str, str]):
         res_dict: A dictionary of resnames, where each resname is a key
             and the corresponding values are the selection language.
     """
-    u.add_TopologyAttr("resname")
+    if not hasattr(u.residues, "resnames"):
+        u.add_TopologyAttr("resname")
     for key, val in res_dict.items():
         res_group = u.select_atoms(val)
         res_names = res_group.residues.resnames
@@ -97,18 +221,21 @@ def res_dict_from_select_dict(u: Universe, select_dict: dict[str, str]) -> dict[
     Return:
         A dictionary of resnames.
     """
-    saved_select = []
+    saved_ids = set()
+    group_cache = {}
     res_dict = {}
     for key, val in select_dict.items():
-        res_select = "same resid as (" + val + ")"
+        res_select = _res_sel(val)
         res_group = u.select_atoms(res_select)
-        if key in ["cation", "anion"] or res_group not in saved_select:
-            saved_select.append(res_group)
+        group_id = res_group.indices.tobytes()
+        if key in ["cation", "anion"] or group_id not in saved_ids:
+            saved_ids.add(group_id)
+            group_cache[key] = res_group
             res_dict[key] = res_select
     if (
         "cation" in res_dict
         and "anion" in res_dict
-        and u.select_atoms(res_dict.get("cation")) == u.select_atoms(res_dict.get("anion"))
+        and np.array_equal(group_cache["cation"].indices, group_cache["anion"].indices)
     ):
         res_dict.pop("anion")
         res_dict["salt"] = res_dict.pop("cation")
@@ -127,28 +254,28 @@ def res_dict_from_datafile(filename: str) -> dict[str, str]:
     """
     res_dict = {}
     with open(filename) as f:
-        lines = f.readlines()
-        if lines[0] == "Generated by pymatgen.io.lammps.data.LammpsData\n" and lines[1].startswith("#"):
-            elyte_info = re.findall(r"\w+", lines[1])
-            it = iter(elyte_info)
-            idx = 1
-            for num in it:
+        first_line = f.readline()
+        second_line = f.readline()
+    if first_line == "Generated by pymatgen.io.lammps.data.LammpsData\n" and second_line.startswith("#"):
+        elyte_info = _HEADER_RE.findall(second_line)
+        it = iter(elyte_info)
+        idx = 1
+        for num in it:
+            name = next(it)
+            if name.isnumeric():
+                frag = int(name)
                 name = next(it)
-                if name.isnumeric():
-                    frag = int(name)
-                    name = next(it)
-                    names = [name + c for c in string.ascii_lowercase[0:frag]]
-                    start = idx
-                    idx += int(num) * frag
-                    for i, n in enumerate(names):
-                        res_dict[n] = "same mass as resid " + str(start + i)
-                else:
-                    start = idx
-                    idx += int(num)
-                    end = idx
-                    res_dict[name] = "resid " + str(start) + "-" + str(end - 1)
-            return res_dict
-        raise ValueError("The LAMMPS data file should be generated by pymatgen.io.lammps.data.")
+                start = idx
+                idx += int(num) * frag
+                for i in range(frag):
+                    res_dict[f"{name}{string.ascii_lowercase[i]}"] = f"same mass as resid {start + i}"
+            else:
+                start = idx
+                idx += int(num)
+                end = idx
+                res_dict[name] = "resid " + str(start) + "-" + str(end - 1)
+        return res_dict
+    raise ValueError("The LAMMPS data file should be generated by pymatgen.io.lammps.data.")
 
 
 def res_dict_from_lammpsdata(lammps_data: CombinedData) -> dict[str, str]:
@@ -173,11 +300,10 @@ def res_dict_from_lammpsdata(lammps_data: CombinedData) -> dict[str, str]:
                 end = idx
                 res_dict[name] = "resid " + str(start) + "-" + str(end - 1)
             else:
-                names = [name + c for c in string.ascii_lowercase[0:frag]]
                 start = idx
                 idx += int(num) * frag
-                for i, n in enumerate(names):
-                    res_dict[n] = "same mass as resid " + str(start + i)
+                for i in range(frag):
+                    res_dict[f"{name}{string.ascii_lowercase[i]}"] = f"same mass as resid {start + i}"
     else:
         for name, num in zip(lammps_data.names, lammps_data.nums):
             start = idx
@@ -187,6 +313,22 @@ def res_dict_from_lammpsdata(lammps_data: CombinedData) -> dict[str, str]:
     return res_dict
 
 
+def _fragment_charges(frags: tuple[AtomGroup, ...]) -> np.ndarray:
+    """
+    Sum the atom charges of each fragment with a single grouped reduction.
+
+    Args:
+        frags: A tuple of fragment AtomGroups from the same universe.
+
+    Return:
+        The total charge per fragment.
+    """
+    all_idx = np.concatenate([frag.indices for frag in frags])
+    group_ids = np.repeat(np.arange(len(frags)), [len(frag) for frag in frags])
+    all_charges = frags[0].universe.atoms.charges[all_idx]
+    return np.bincount(group_ids, weights=all_charges)
+
+
 def select_dict_from_resname(u: Universe) -> dict[str, str]:
     """
     Infer select_dict (possibly interested atom species selection) from resnames in a MDAnalysis.universe object.
@@ -199,14 +341,16 @@ def select_dict_from_resname(u: Universe) -> dict[str, str]:
         A dictionary of atom species.
     """
     select_dict: dict[str, str] = {}
-    resnames = np.unique(u.residues.resnames)
-    for resname in resnames:
+    resnames, first_res_idx = np.unique(u.residues.resnames, return_index=True)
+    for resname, res_idx in zip(resnames, first_res_idx):
         if resname == "":
             continue
-        residue = u.select_atoms("resname " + resname).residues[0]
-        if np.isclose(residue.charge, 0, atol=1e-5):  # np.sum(residue.atoms.charges)
-            if len(residue.atoms.fragments) == 2:
-                for i, frag in enumerate(residue.atoms.fragments):
+        residue = u.residues[res_idx]
+        res_charge = residue.charge
+        if np.isclose(res_charge, 0, atol=1e-5):  # np.sum(residue.atoms.charges)
+            frags = residue.atoms.fragments
+            if len(frags) == 2:
+                for i, frag in enumerate(frags):
                     charge = np.sum(frag.charges)
                     if charge > 0.001:
                         extract_atom_from_cation(frag, select_dict)
@@ -214,12 +358,11 @@ def select_dict_from_resname(u: Universe) -> dict[str, str]:
                         extract_atom_from_anion(frag, select_dict)
                     else:
                         extract_atom_from_molecule(resname, frag, select_dict, number=i + 1)
-            elif len(residue.atoms.fragments) >= 2:
+            elif len(frags) >= 2:
                 cation_number = 1
                 anion_number = 1
                 molecule_number = 1
-                for frag in residue.atoms.fragments:
-                    charge = np.sum(frag.charges)
+                for frag, charge in zip(frags, _fragment_charges(frags)):
                     if charge > 0.001:
                         extract_atom_from_cation(frag, select_dict, cation_number)
                         cation_number += 1
@@ -231,13 +374,55 @@ def select_dict_from_resname(u: Universe) -> dict[str, str]:
                         molecule_number += 1
             else:
                 extract_atom_from_molecule(resname, residue, select_dict)
-        elif residue.charge > 0:
+        elif res_charge > 0:
             extract_atom_from_cation(residue, select_dict)
         else:
             extract_atom_from_anion(residue, select_dict)
     return select_dict
 
 
+def _extract_atom_from_ion(
+    ion: Residue | AtomGroup, select_dict: dict[str, str], prefix: str, number: int, charge_sign: int
+):
+    """
+    Assign the most charged atom and/or one unique atom in the ion into select_dict.
+
+    Args:
+        ion: Residue or AtomGroup
+        select_dict: A dictionary of atom species, where each atom species name is a key
+            and the corresponding values are the selection language.
+        prefix: "cation" or "anion".
+        number: The serial number of the ion.
+        charge_sign: +1 for cations, -1 for anions.
+    """
+    ion_name = prefix if number == 0 else prefix + "_" + str(number)
+    types = ion.atoms.types
+    if len(types) == 1:
+        select_dict[ion_name] = _type_sel(types[0])
+    else:
+        charges = ion.atoms.charges
+        uniq, inverse = np.unique(types, return_inverse=True)
+        if njit is not None:
+            center_idx, rare_code = _ion_centers(
+                np.ascontiguousarray(charges, dtype=np.float64),
+                np.ascontiguousarray(inverse, dtype=np.int64),
+                len(uniq),
+                charge_sign,
+            )
+        else:
+            # The most charged atom in the ion
+            center_idx = (charge_sign * charges).argmax()
+            rare_code = np.bincount(inverse).argmin()
+        center_type = types[center_idx]
+        # One unique atom in the ion
+        uni_center = uniq[rare_code]
+        if center_type == uni_center:
+            select_dict[ion_name] = _type_sel(uni_center)
+        else:
+            select_dict[ion_name + "_" + ion.atoms.names[center_idx] + center_type] = _type_sel(center_type)
+            select_dict[ion_name] = _type_sel(uni_center)
+
+
 def extract_atom_from_cation(ion: Residue | AtomGroup, select_dict: dict[str, str], number: int = 0):
     """
     Assign the most charged atom and/or one unique atom in the cation into select_dict.
@@ -248,20 +433,7 @@ def extract_atom_from_cation(ion: Residue | AtomGroup, select_dict: dict[str, st
             and the corresponding values are the selection language.
         number: The serial number of the cation.
     """
-    cation_name = "cation" if number == 0 else "cation_" + str(number)
-    if len(ion.atoms.types) == 1:
-        select_dict[cation_name] = "type " + ion.atoms.types[0]
-    else:
-        # The most positively charged atom in the cation
-        pos_center = ion.atoms[np.argmax(ion.atoms.charges)]
-        unique_types = np.unique(ion.atoms.types, return_counts=True)
-        # One unique atom in the cation
-        uni_center = unique_types[0][np.argmin(unique_types[1])]
-        if pos_center.type == uni_center:
-            select_dict[cation_name] = "type " + uni_center
-        else:
-            select_dict[cation_name + "_" + pos_center.name + pos_center.type] = "type " + pos_center.type
-            select_dict[cation_name] = "type " + uni_center
+    _extract_atom_from_ion(ion, select_dict, "cation", number, 1)
 
 
 def extract_atom_from_anion(ion: Residue | AtomGroup, select_dict: dict[str, str], number: int = 0):
@@ -274,20 +446,7 @@ def extract_atom_from_anion(ion: Residue | AtomGroup, select_dict: dict[str, str
             and the corresponding values are the selection language.
         number: The serial number of the anion.
     """
-    anion_name = "anion" if number == 0 else "anion_" + str(number)
-    if len(ion.atoms.types) == 1:
-        select_dict[anion_name] = "type " + ion.atoms.types[0]
-    else:
-        # The most negatively charged atom in the anion
-        neg_center = ion.atoms[np.argmin(ion.atoms.charges)]
-        unique_types = np.unique(ion.atoms.types, return_counts=True)
-        # One unique atom in the anion
-        uni_center = unique_types[0][np.argmin(unique_types[1])]
-        if neg_center.type == uni_center:
-            select_dict[anion_name] = "type " + uni_center
-        else:
-            select_dict[anion_name + "_" + neg_center.name + neg_center.type] = "type " + neg_center.type
-            select_dict[anion_name] = "type " + uni_center
+    _extract_atom_from_ion(ion, select_dict, "anion", number, -1)
 
 
 def extract_atom_from_molecule(
@@ -311,5 +470,5 @@ def extract_atom_from_molecule(
     # The most negatively charged atom in the anion
     if number > 0:
         resname = resname + "_" + str(number)
-    neg_center = molecule.atoms[np.argmin(molecule.atoms.charges)]
-    select_dict[resname] = "type " + neg_center.type
+    neg_idx = molecule.atoms.charges.argmin()
+    select_dict[resname] = _type_sel(molecule.atoms.types[neg_idx])